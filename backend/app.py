@@ -1,7 +1,20 @@
 import os
+import re
+import io
+import sys
+import hmac
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import functools
+from collections import Counter
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, send_from_directory, abort
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import pickle
 from prophet import Prophet
 from statsmodels.tsa.statespace.sarimax import SARIMAX
@@ -18,6 +31,194 @@ logging.basicConfig(level=logging.INFO)
 
 MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'time_series_models'))
 
+# Request profiling (opt-in). A profile is only recorded or served when the
+# client sends PROFILE_TOKEN in the X-Profile-Token header; PROFILE_ALLOWLIST
+# (comma-separated IP addresses) optionally narrows this down further.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_ALLOWLIST = {ip.strip() for ip in os.environ.get('PROFILE_ALLOWLIST', '').split(',') if ip.strip()}
+PROFILE_DIR = os.path.abspath(os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles')))
+PROFILE_MAX_ENTRIES = max(1, int(os.environ.get('PROFILE_MAX_ENTRIES', '20')))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{20}-[a-z]+-[0-9a-f]{8}$')
+PROFILE_FILE_TYPES = {'pstats': 'pstats', 'collapsed': 'collapsed.txt', 'stats': 'stats.txt'}
+
+# Number of reverse proxies in front of the app (1 on Render), so that
+# request.remote_addr is the real client address for PROFILE_ALLOWLIST.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
+# Only one request is profiled at a time: cProfile cannot run two profilers
+# at once, and it keeps the profiling overhead on production traffic bounded.
+_profile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Periodically samples the call stack of one thread and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Returns the samples in the collapsed-stack format used by flamegraph tools."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def profiling_allowed():
+    if not PROFILE_TOKEN:
+        return False
+    token = request.headers.get('X-Profile-Token', '')
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return False
+    return not PROFILE_ALLOWLIST or request.remote_addr in PROFILE_ALLOWLIST
+
+
+def requested_profile_mode():
+    """Returns 'sample' or 'cprofile' if the request asks to be profiled, otherwise None."""
+    flag = (request.headers.get('X-Profile') or request.args.get('profile') or '').lower()
+    if flag in ('1', 'true', 'yes', 'sample'):
+        return 'sample'
+    if flag == 'cprofile':
+        return 'cprofile'
+    return None
+
+
+def list_profiles():
+    """Returns the stored profiles, newest first, including ones whose metadata is missing."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = {}
+    for name in os.listdir(PROFILE_DIR):
+        profile_id, _, suffix = name.partition('.')
+        if PROFILE_ID_PATTERN.match(profile_id):
+            files.setdefault(profile_id, []).append(suffix)
+
+    profiles = []
+    for profile_id, suffixes in files.items():
+        metadata = {'id': profile_id}
+        if 'json' in suffixes:
+            try:
+                with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError) as e:
+                app.logger.warning(f"Unreadable metadata for profile {profile_id}: {e}")
+        metadata['files'] = [t for t, suffix in PROFILE_FILE_TYPES.items() if suffix in suffixes]
+        profiles.append(metadata)
+    return sorted(profiles, key=lambda p: p['id'], reverse=True)
+
+
+def remove_profile(profile_id):
+    if not os.path.isdir(PROFILE_DIR):
+        return
+    for name in os.listdir(PROFILE_DIR):
+        if name.startswith(f"{profile_id}."):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(profile_id, mode, profiler, duration):
+    """Writes the profile to disk and drops the oldest entries beyond PROFILE_MAX_ENTRIES."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+
+    if mode == 'cprofile':
+        profiler.dump_stats(f"{base}.{PROFILE_FILE_TYPES['pstats']}")
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(50)
+        with open(f"{base}.{PROFILE_FILE_TYPES['stats']}", 'w') as f:
+            f.write(stats_text.getvalue())
+    else:
+        with open(f"{base}.{PROFILE_FILE_TYPES['collapsed']}", 'w') as f:
+            f.write(profiler.collapsed())
+
+    body = request.get_json(silent=True) or {}
+    metadata = {
+        'id': profile_id,
+        'endpoint': profile_id.split('-')[1],
+        'mode': mode,
+        'commodity': request.args.get('commodity') or body.get('commodity'),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'duration_ms': round(duration * 1000, 1),
+    }
+    if mode == 'sample':
+        metadata['samples'] = sum(profiler.samples.values())
+    with open(f"{base}.json", 'w') as f:
+        json.dump(metadata, f)
+
+    older = [p for p in list_profiles() if p['id'] != profile_id]
+    for old in older[PROFILE_MAX_ENTRIES - 1:]:
+        remove_profile(old['id'])
+
+
+def profiled(view):
+    """Runs the view under the stack sampler or cProfile when an allowed client asks for it."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_profile_mode()
+        if mode is None:
+            return view(*args, **kwargs)
+        if not profiling_allowed():
+            app.logger.warning(f"Rejected profiling request from {request.remote_addr}.")
+            return view(*args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            app.logger.warning("Another request is already being profiled; serving without profiling.")
+            return view(*args, **kwargs)
+
+        try:
+            if mode == 'cprofile':
+                profiler = cProfile.Profile()
+                start, stop = profiler.enable, profiler.disable
+            else:
+                profiler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+                start, stop = profiler.start, profiler.stop
+            started = time.perf_counter()
+            start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                stop()
+            duration = time.perf_counter() - started
+
+            endpoint = request.path.rstrip('/').rsplit('/', 1)[-1]
+            profile_id = f"{time.time_ns():020d}-{endpoint}-{uuid.uuid4().hex[:8]}"
+            try:
+                save_profile(profile_id, mode, profiler, duration)
+            except Exception as e:
+                app.logger.error(f"Error saving profile for {request.path}: {e}", exc_info=True)
+                remove_profile(profile_id)
+                return response
+        finally:
+            _profile_lock.release()
+
+        app.logger.info(f"Stored {mode} profile {profile_id} for {request.path} ({duration * 1000:.1f} ms)")
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+    return wrapper
+
 def get_commodity_list():
     """Returns a list of available commodities by scanning the model directory."""
     try:
@@ -143,6 +344,7 @@ def commodities():
     return jsonify(commodity_list)
 
 @app.route('/api/history', methods=['GET'])
+@profiled
 def get_history():
     commodity = request.args.get('commodity')
     if not commodity:
@@ -172,6 +374,7 @@ def get_history():
         return jsonify({"error": "Terjadi kesalahan saat mengambil data historis."}), 500
 
 @app.route('/api/predict', methods=['POST'])
+@profiled
 def predict():
     """Endpoint to generate price predictions."""
     data = request.get_json()
@@ -282,6 +485,23 @@ def predict():
         app.logger.error(f"Error during prediction for {commodity}: {e}", exc_info=True)
         return jsonify({'error': 'Terjadi kesalahan tak terduga saat membuat prediksi.'}), 500
 
+@app.route('/api/profiles', methods=['GET'])
+def profiles():
+    """Endpoint to list the stored request profiles."""
+    if not profiling_allowed():
+        return jsonify({'error': 'Profiling is not enabled for this client.'}), 403
+    return jsonify({'profiles': list_profiles()})
+
+@app.route('/api/profiles/<profile_id>/<file_type>', methods=['GET'])
+def download_profile(profile_id, file_type):
+    """Endpoint to download a stored profile as pstats, collapsed stacks or a text summary."""
+    if not profiling_allowed():
+        return jsonify({'error': 'Profiling is not enabled for this client.'}), 403
+    if not PROFILE_ID_PATTERN.match(profile_id) or file_type not in PROFILE_FILE_TYPES:
+        abort(404)
+    filename = f"{profile_id}.{PROFILE_FILE_TYPES[file_type]}"
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
 if __name__ == '__main__':
   
     app.run(debug=False, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+
+import pytest
+from flask import jsonify
+
+import app as app_module
+from app import app, profiled
+
+TOKEN = 'secret-token'
+
+
+@profiled
+def stub_view():
+    return jsonify({'ok': True})
+
+
+@profiled
+def failing_view():
+    raise RuntimeError('boom')
+
+
+app.add_url_rule('/api/stub', 'stub', stub_view)
+app.add_url_rule('/api/failing', 'failing', failing_view)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_TOKEN', TOKEN)
+    monkeypatch.setattr(app_module, 'PROFILE_ALLOWLIST', set())
+    monkeypatch.setattr(app_module, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'PROFILE_MAX_ENTRIES', 20)
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def profile(client, mode='sample', token=TOKEN):
+    return client.get(f'/api/stub?profile={mode}', headers={'X-Profile-Token': token})
+
+
+def test_unprofiled_request_stores_nothing(client, tmp_path):
+    response = client.get('/api/stub', headers={'X-Profile-Token': TOKEN})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejects_wrong_token(client, tmp_path):
+    response = profile(client, token='wrong')
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert os.listdir(tmp_path) == []
+    assert client.get('/api/profiles', headers={'X-Profile-Token': 'wrong'}).status_code == 403
+    assert client.get('/api/profiles').status_code == 403
+
+
+def test_rejects_client_outside_allowlist(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_ALLOWLIST', {'10.0.0.1'})
+    response = profile(client)
+    assert 'X-Profile-Id' not in response.headers
+    assert client.get('/api/profiles', headers={'X-Profile-Token': TOKEN}).status_code == 403
+
+
+def test_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_TOKEN', '')
+    response = profile(client, token='')
+    assert 'X-Profile-Id' not in response.headers
+    assert client.get('/api/profiles').status_code == 403
+
+
+@pytest.mark.parametrize('mode, file_types', [
+    ('sample', ['collapsed']),
+    ('cprofile', ['pstats', 'stats']),
+])
+def test_profile_is_listed_and_downloadable(client, mode, file_types):
+    response = profile(client, mode)
+    profile_id = response.headers['X-Profile-Id']
+
+    listed = client.get('/api/profiles', headers={'X-Profile-Token': TOKEN}).get_json()['profiles']
+    assert [p['id'] for p in listed] == [profile_id]
+    assert listed[0]['mode'] == mode
+    assert listed[0]['endpoint'] == 'stub'
+    assert listed[0]['files'] == file_types
+
+    for file_type in file_types:
+        download = client.get(f'/api/profiles/{profile_id}/{file_type}', headers={'X-Profile-Token': TOKEN})
+        assert download.status_code == 200
+
+
+def test_ring_buffer_is_pruned(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, 'PROFILE_MAX_ENTRIES', 3)
+    ids = [profile(client).headers['X-Profile-Id'] for _ in range(5)]
+
+    listed = client.get('/api/profiles', headers={'X-Profile-Token': TOKEN}).get_json()['profiles']
+    assert [p['id'] for p in listed] == ids[:1:-1]
+    assert len(os.listdir(tmp_path)) == 3 * 2
+
+
+def test_ring_buffer_prunes_incomplete_entries(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, 'PROFILE_MAX_ENTRIES', 1)
+    orphan = tmp_path / f"{0:020d}-stub-00000000.pstats"
+    orphan.write_text('')
+
+    profile_id = profile(client).headers['X-Profile-Id']
+    assert not orphan.exists()
+    assert sorted(os.listdir(tmp_path)) == [f'{profile_id}.collapsed.txt', f'{profile_id}.json']
+
+
+def test_failed_save_leaves_no_files(client, monkeypatch, tmp_path):
+    def broken_dump(self, *args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(app_module.StackSampler, 'collapsed', broken_dump)
+    response = profile(client)
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('path', [
+    '/api/profiles/not-an-id/pstats',
+    '/api/profiles/..%2Fapp/pstats',
+    f'/api/profiles/{0:020d}-stub-00000000/json',
+    f'/api/profiles/{0:020d}-stub-00000000/pstats',
+])
+def test_download_rejects_unknown_profiles(client, path):
+    assert client.get(path, headers={'X-Profile-Token': TOKEN}).status_code == 404
+
+
+def test_lock_is_released_when_view_raises(client):
+    with pytest.raises(RuntimeError):
+        client.get('/api/failing?profile=cprofile', headers={'X-Profile-Token': TOKEN})
+    assert not app_module._profile_lock.locked()
+    assert 'X-Profile-Id' in profile(client).headers